@@ -3,17 +3,18 @@ from __future__ import annotations
 import sys
 import inspect
 from collections import defaultdict
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 
 import psycopg
 import psycopg_pool
-from psycopg.rows import namedtuple_row, class_row, dict_row
+from psycopg.rows import namedtuple_row, class_row, dict_row, no_result
+from psycopg.types.json import set_json_loads
 
 from .exceptions import *
 from .db_table import *
 from .db_field import *
 from .db_types import *
-from .translator import Translator
+from .translator import Translator, json_loads
 
 import typing
 
@@ -21,6 +22,8 @@ if typing.TYPE_CHECKING:
     from typing import *
     from types import SimpleNamespace
     from .query import DBQuery, DBSQL
+    from psycopg.cursor import BaseCursor
+    from psycopg.rows import RowFactory, RowMaker
 
 __all__ = ['DBFactory']
 
@@ -41,13 +44,18 @@ class DBFactory:
         debug_mode = kwargs.pop("debug_mode", False)
         conninfo = kwargs.pop("conninfo")
         try:
-            pool = psycopg_pool.ConnectionPool(conninfo, kwargs=kwargs)
+            pool = psycopg_pool.ConnectionPool(conninfo, kwargs=kwargs, configure=DBFactory.configure_connection)
             pool.wait()
         except Exception as e:
             print(str(e))
             return None
         return DBFactory(pool, debug_mode)
 
+    @staticmethod
+    def configure_connection(conn: psycopg.Connection):
+        # parse json/jsonb columns with the same library the translator dumps them with
+        set_json_loads(json_loads, conn)
+
     def use(self, cls: type[DBTable], schema: str = 'public'):
         cls.DB.db = self
         if not cls.DB.schema:
@@ -102,19 +110,49 @@ class DBFactory:
             query.filter(lambda s: getattr(s, k) == v)
         return query.fetchone()
 
+    def prefetch(self, items: Sequence[T], *field_names: str) -> Sequence[T]:
+        # load Many/ManyToMany collections for all items with one query per field, instead of a query per item
+        from .query import DBSQL
+        if not items:
+            return items
+        DB = items[0].DB
+        by_pk = {item.pk: item for item in items}
+        indices = list(by_pk)
+        for field_name in field_names:
+            groups = defaultdict(list)
+            if field := DB.many_fields.get(field_name):
+                query = self.query(field.source_table)
+                ref = getattr(query.scheme, field.source_field)
+                query.filter(DBSQL(query, f'{ref} = ANY({query.arg(indices)})'))
+                for row in query:
+                    groups[getattr(row, field.source_field)._pk_id].append(row)
+            elif field := DB.many_to_many_fields.get(field_name):
+                links_sql = self._trans.select_many_links(field.middle_table, field.source_field, field.source_table.DB.table)
+                with self.connection() as conn:
+                    links = conn.execute(links_sql, (indices, )).fetchall()
+                if links:
+                    query = self.query(field.source_table)
+                    query.filter(DBSQL(query, f'{query.scheme.pk} = ANY({query.arg(list({link[1] for link in links}))})'))
+                    related = {row.pk: row for row in query}
+                    for primary, secondary in links:
+                        groups[primary].append(related[secondary])
+            else:
+                raise QuazyFieldNameError(f'Table `{DB.table}` has no Many field `{field_name}`')
+            for pk, item in by_pk.items():
+                setattr(item, field_name, groups[pk])
+        return items
+
     def get_connection(self) -> psycopg.Connection:
         return self._connection_pool.getconn()
 
     def release_connection(self, conn: psycopg.Connection):
         self._connection_pool.putconn(conn)
 
-    @contextmanager
-    def connection(self, reuse_conn: psycopg.Connection = None) -> psycopg.Connection:
+    def connection(self, reuse_conn: psycopg.Connection = None) -> ContextManager[psycopg.Connection]:
+        # no extra generator frame on top of the pool's own context manager
         if reuse_conn is not None:
-            yield reuse_conn
-        else:
-            with self._connection_pool.connection() as conn:
-                yield conn
+            return nullcontext(reuse_conn)
+        return self._connection_pool.connection()
 
     def clear(self, schema: str = None):
         with self.connection() as conn:  # type: psycopg.Connection
@@ -122,7 +160,8 @@ class DBFactory:
             for res in conn.execute(self._trans.select_all_tables()):
                 if not schema or schema == res[0]:
                     tables.append(f'"{res[0]}"."{res[1]}"')
-            with conn.transaction():
+            # statements don't return rows, send them without waiting for each result
+            with conn.pipeline(), conn.transaction():
                 for table in tables:
                     conn.execute(f'DROP TABLE {table} CASCADE')
 
@@ -223,7 +262,7 @@ class DBFactory:
                 all_schemas.add(table.DB.schema)
 
         with self.connection() as conn:  # type: psycopg.Connection
-            with conn.transaction():
+            with conn.pipeline(), conn.transaction():
                 for schema in all_schemas:
                     conn.execute(self._trans.create_schema(schema))
                 for table in all_tables:
@@ -237,8 +276,8 @@ class DBFactory:
                         if field.ref and not field.prop:
                             conn.execute(self._trans.add_reference(table, field))
 
-    def insert(self, item: T) -> T:
-        item._before_insert(self)
+    @staticmethod
+    def _insert_fields(item: T) -> list[tuple[DBField, Any]]:
         fields: list[tuple[DBField, Any]] = []
         for name, field in item.DB.fields.items():
             if field.cid:
@@ -252,54 +291,129 @@ class DBFactory:
                 fields.append((field, value))
             else:
                 fields.append((field, getattr(item, name, DefaultValue)))
+        return fields
+
+    @staticmethod
+    def _row_fields(row: DBTable) -> list[tuple[DBField, Any]]:
+        return [(field, getattr(row, name, DefaultValue)) for name, field in row.DB.fields.items()]
+
+    def _insert_batch(self, curr: psycopg.Cursor, table: type[DBTable], rows: list[DBTable],
+                      fields: list[list[tuple[DBField, Any]]]):
+        for sql, indices, values in self._trans.insert_bulk(table, fields):
+            curr.executemany(sql, values, returning=True)
+            for i in indices:
+                rows[i].pk = curr.fetchone()[0]
+                curr.nextset()
+
+    def _insert_subtables(self, conn: psycopg.Connection, item: T):
+        with conn.cursor() as curr:
+            for field_name, table in item.DB.subtables.items():
+                rows = getattr(item, field_name)
+                if not rows:
+                    continue
+                for row in rows:
+                    setattr(row, item.DB.table, item)
+                self._insert_batch(curr, table, rows, [self._row_fields(row) for row in rows])
+
+    def _insert_related(self, conn: psycopg.Connection, item: T):
+        for field_name, field in item.DB.many_fields.items():
+            for row in getattr(item, field_name):
+                if getattr(row, field.source_field) != item.pk:
+                    setattr(row, field.source_field, item.pk)
+                    self.save(row)
+
+        for field_name, field in item.DB.many_to_many_fields.items():
+            for row in getattr(item, field_name):
+                if not row.pk:
+                    self.save(row)
+
+            # delete old items, add new items
+            new_indices = set(row.pk for row in getattr(item, field_name))
+            old_indices_sql = self._trans.select_many_indices(field.middle_table, field.source_field, field.source_table.DB.table)
+            results = conn.execute(old_indices_sql, (item.pk, )).fetchone()
+            old_indices = set(results[0]) if results[0] else set()
+
+            indices_to_delete = list(old_indices - new_indices)
+            indices_to_add = list(new_indices - old_indices)
+
+            if indices_to_delete:
+                delete_indices_sql = self._trans.delete_many_indices(field.middle_table, field.source_field, field.source_table.DB.table)
+                conn.execute(delete_indices_sql, (item.pk, indices_to_delete))
+
+            if indices_to_add:
+                new_indices_sql = self._trans.insert_many_index(field.middle_table, field.source_field, field.source_table.DB.table)
+                with conn.cursor() as curr:
+                    curr.executemany(new_indices_sql, [(item.pk, index) for index in indices_to_add])
+
+    def insert(self, item: T) -> T:
+        item._before_insert(self)
+        fields = self._insert_fields(item)
 
         with self.connection() as conn:  # type: psycopg.Connection
 
             sql, values = self._trans.insert(item.__class__, fields)
-            item.pk = conn.execute(sql, values).fetchone()[0]
-
-            for field_name, table in item.DB.subtables.items():
-                for row in getattr(item, field_name):
-                    setattr(row, item.DB.table, item)
-                    fields.clear()
-                    for name, field in table.DB.fields.items():
-                        fields.append((field, getattr(row, name, DefaultValue)))
-                    sql, values = self._trans.insert(row.__class__, fields)
-                    new_sub_id = conn.execute(sql, values).fetchone()[0]
-                    setattr(row, table.DB.pk.name, new_sub_id)
-
-            for field_name, field in item.DB.many_fields.items():
-                for row in getattr(item, field_name):
-                    if getattr(row, field.source_field) != item.pk:
-                        setattr(row, field.source_field, item.pk)
-                        self.save(row)
-
-            for field_name, field in item.DB.many_to_many_fields.items():
-                for row in getattr(item, field_name):
-                    if not row.pk:
-                        self.save(row)
-
-                # delete old items, add new items
-                new_indices = set(row.pk for row in getattr(item, field_name))
-                old_indices_sql = self._trans.select_many_indices(field.middle_table, field.source_field, field.source_table.DB.table)
-                results = conn.execute(old_indices_sql, {"value": item.pk}).fetchone()
-                old_indices = set(results[0]) if results[0] else set()
-
-                indices_to_delete = list(old_indices - new_indices)
-                indices_to_add = list(new_indices - old_indices)
-
-                if indices_to_delete:
-                    delete_indices_sql = self._trans.delete_many_indices(field.middle_table, field.source_field, field.source_table.DB.table)
-                    conn.execute(delete_indices_sql, {"value": item.pk, "indices": indices_to_delete})
-
-                if indices_to_add:
-                    new_indices_sql = self._trans.insert_many_index(field.middle_table, field.source_field, field.source_table.DB.table)
-                    for index in indices_to_add:
-                        conn.execute(new_indices_sql, {"value": item.pk, "index": index})
+            # the text is interned per column set, so prepare it on first use rather than after psycopg's threshold
+            item.pk = conn.execute(sql, values, prepare=True).fetchone()[0]
+            self._insert_subtables(conn, item)
+            self._insert_related(conn, item)
 
         item._after_insert(self)
         return item
 
+    def insert_many(self, items: Iterable[T]) -> list[T]:
+        items = list(items)
+        by_table: dict[type[DBTable], list[T]] = defaultdict(list)
+        for item in items:
+            item._before_insert(self)
+            by_table[item.__class__].append(item)
+
+        with self.connection() as conn:  # type: psycopg.Connection
+            with conn.cursor() as curr:
+                for table, rows in by_table.items():
+                    self._insert_batch(curr, table, rows, [self._insert_fields(item) for item in rows])
+
+                # child rows of all items, one batch per sub table once parent keys are known
+                sub_rows: dict[type[DBTable], list[DBTable]] = defaultdict(list)
+                for item in items:
+                    for field_name in item.DB.subtables:
+                        for row in getattr(item, field_name):
+                            setattr(row, item.DB.table, item)
+                            sub_rows[row.__class__].append(row)
+                for table, rows in sub_rows.items():
+                    self._insert_batch(curr, table, rows, [self._row_fields(row) for row in rows])
+
+            for item in items:
+                self._insert_related(conn, item)
+
+        for item in items:
+            item._after_insert(self)
+        return items
+
+    def copy_from(self, table_class: type[T], items: Iterable[T]) -> list[T]:
+        """Bulk load plain rows with COPY.
+
+        COPY returns no keys: the returned items have no `pk`, and `_after_insert` is not called for them.
+        Tables with sub tables, Many/ManyToMany fields or a body are not supported, use `insert_many` for those.
+        """
+        DB = table_class.DB
+        if DB.subtables or DB.many_fields or DB.many_to_many_fields:
+            raise QuazyNotSupported(f'COPY is not supported for table `{DB.table}` with sub tables or link fields')
+        items = list(items)
+        batches: dict[str, list[tuple[Any, ...]]] = defaultdict(list)
+        for item in items:
+            item._before_insert(self)
+            sql, values = self._trans.copy(table_class, self._insert_fields(item))
+            batches[sql].append(values)
+
+        with self.connection() as conn:  # type: psycopg.Connection
+            with conn.cursor() as curr:
+                for sql, rows in batches.items():
+                    with curr.copy(sql) as copy:
+                        for row in rows:
+                            copy.write_row(row)
+
+        return items
+
     def update(self, item: T) -> T:
         item._before_update(self)
         fields: list[tuple[DBField, Any]] = []
@@ -310,8 +424,8 @@ class DBFactory:
             sql, values = self._trans.update(item.__class__, fields)
             if not values:
                 return item
-            values['v1'] = getattr(item, item.DB.pk.name)
-            conn.execute(sql, values)
+            values.append(getattr(item, item.DB.pk.name))
+            conn.execute(sql, values, prepare=True)
 
             for table in item.DB.subtables.values():
                 sql = self._trans.delete_related(table, item.DB.table)
@@ -321,6 +435,24 @@ class DBFactory:
         item._after_update(self)
         return item
 
+    def _object_row(self, table_class: type[T]) -> RowFactory[T]:
+        if table_class.__init__ is not DBTable.__init__:
+            return class_row(lambda **kwargs: table_class(_db_=self, **kwargs))
+
+        def object_row(cursor: BaseCursor[Any, T]) -> RowMaker[T]:
+            if (desc := cursor.description) is None:
+                return no_result
+            return table_class._hydrator(self, [col.name for col in desc])
+
+        return object_row
+
+    def _query_row(self, query: DBQuery[T], as_dict: bool = False) -> RowFactory:
+        if as_dict:
+            return dict_row
+        if query.fetch_objects:
+            return self._object_row(query.table_class)
+        return namedtuple_row
+
     @contextmanager
     def select(self, query: Union[DBQuery, str], as_dict: bool = False) -> Iterator[DBTable | SimpleNamespace]:
         from quazy.query import DBQuery
@@ -328,21 +460,27 @@ class DBFactory:
             if isinstance(query, DBQuery):
                 sql = self._trans.select(query)
                 if self._debug_mode: print(sql)
-                if as_dict:
-                    row_factory = dict_row
-                elif query.fetch_objects:
-                    row_factory = class_row(lambda **kwargs: query.table_class(_db_=self, **kwargs))
-                else:
-                    row_factory = namedtuple_row
-                with conn.cursor(binary=True, row_factory=row_factory) as curr:
-                    yield curr.execute(sql, query.args)
+                with conn.cursor(binary=True, row_factory=self._query_row(query, as_dict)) as curr:
+                    # queries with variables are server-side prepared on the first run
+                    yield curr.execute(sql, query.args, prepare=query._prepare or None)
             else:
                 with conn.cursor(binary=True, row_factory=dict_row if as_dict else namedtuple_row) as curr:
                     yield curr.execute(query)
 
+    @contextmanager
+    def stream(self, query: DBQuery[T], size: int = 1000, as_dict: bool = False) -> Iterator[Iterator[T | SimpleNamespace]]:
+        # server-side cursor: rows arrive in chunks of `size` instead of the whole result at once;
+        # it needs an open transaction, so the connection is held until the `with` block ends
+        sql = self._trans.select(query)
+        if self._debug_mode: print(sql)
+        with self.connection() as conn:  # type: psycopg.Connection
+            with conn.cursor(f'{query.name}_stream', binary=True, row_factory=self._query_row(query, as_dict)) as curr:
+                curr.itersize = size
+                curr.execute(sql, query.args)
+                yield curr
+
     def describe(self, query: Union[DBQuery[T], str]) -> list[DBField]:
         from quazy.query import DBQuery
-        from psycopg.rows import no_result
         if typing.TYPE_CHECKING:
             from psycopg.cursor import BaseCursor, RowMaker
             from psycopg.rows import DictRow
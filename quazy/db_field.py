@@ -28,15 +28,23 @@ class DBField:
     reverse_name: str = None                               # reverse name for reference fields
     # many_field: bool = data_field(default=False, init=False)
     ux: Optional[UX] = None                                # UX/UI options
+    _qcol: str = data_field(default='', init=False, repr=False, compare=False)  # quoted column name for SQL
 
     def __post_init__(self):
         if self.default is not None or self.default_sql is not None:
             self.required = False
 
+    def __setattr__(self, key, value):
+        super().__setattr__(key, value)
+        if key == 'column':
+            # keep the quoted name in step with later renames (migrations, field subclasses)
+            super().__setattr__('_qcol', f'"{value}"')
+
     def prepare(self, name: str):
         self.name = name
         if not self.column:
             self.column = self.name
+        self._qcol = f'"{self.column}"'
         if not self.ux:
             self.ux = UX(self.name, blank=not self.required)
         else:
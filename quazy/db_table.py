@@ -45,6 +45,7 @@ class MetaTable(type):
 
         DB.many_fields = dict()
         DB.many_to_many_fields = dict()
+        DB.sql_cache = dict()
         MetaTable.collect_fields(bases, DB, attrs)
 
         qualname = attrs['__qualname__']
@@ -191,6 +192,8 @@ class DBTable(metaclass=MetaTable):
         many_to_many_fields: typing.ClassVar[dict[str, DBManyToManyField]] = None
         fields: typing.ClassVar[dict[str, DBField]] = None  # list of all fields
         lookup_field: typing.ClassVar[str] = None  # field name for text search
+        sql_cache: typing.ClassVar[dict[tuple, Any]] = None  # rendered DML statements and pk derived helpers, lives with the table
+        init_fields: typing.ClassVar[tuple[dict[str, Callable], frozenset[str]]] = None  # field converters for __init__
         # * marked attributes are able to modify by descendants
 
     class ItemGetter:
@@ -214,6 +217,9 @@ class DBTable(metaclass=MetaTable):
     def resolve_types(cls, globalns):
         from .db_factory import DBFactory
 
+        # field set and types change here, drop anything derived from them before
+        cls._reset_caches()
+
         # eval annotations
         for name, t in typing.get_type_hints(cls, globals() | globalns, locals()).items():
             if name not in cls.DB.fields:  # or cls.fields[name].type is not None:
@@ -322,6 +328,7 @@ class DBTable(metaclass=MetaTable):
 
     @classmethod
     def resolve_types_many(cls, add_middle_table: Callable[[type[DBTable]], Any]):
+        cls._reset_caches()
         # eval refs
         for name, field in cls.DB.fields.items():
             if field.ref:
@@ -388,38 +395,77 @@ class DBTable(metaclass=MetaTable):
         # for field_name, field in self.fields.items():
         #    if field.many_field:
         #        setattr(self, field_name, set())
-        for field_name, field in self.DB.many_fields.items():
-            setattr(self, field_name, set())
+        self._fill(initial)
+
+    def _fill(self, initial: dict[str, Any]):
+        # shared by `__init__` and fetched rows (see `_hydrator`)
+        state = self.__dict__
+        # Many collections are lists everywhere (stubs, `DBFactory.prefetch`): rows compare by pk and are not hashable
+        for field_name in self.DB.many_fields:
+            state[field_name] = list()
+        db = self._db_
+        converters, names = self._init_fields()
         for k, v in initial.items():
             if k.endswith("__view"):
                 continue
-            if self._db_:
-                if field := self.DB.fields.get(k):
-                    if issubclass(field.type, Enum):
-                        setattr(self, k, field.type(v) if v is not None else None)
-                        continue
-                    elif field.ref:
-                        view = initial.get(f'{k}__view', None)
-                        setattr(self, k, DBTable.ItemGetter(self._db_, field.type, v, view))
-                        continue
-            # else:
-            if k not in self.DB.fields and k not in self.DB.many_fields and k not in self.DB.many_to_many_fields:
+            if db and (convert := converters.get(k)) is not None:
+                state[k] = convert(db, v, initial)
+                continue
+            if k not in names:
                 raise QuazyFieldNameError(f'Wrong field name `{k}` in new instance of `{self.__class__.__name__}`')
 
             # TODO: validate types
-            setattr(self, k, v)
+            state[k] = v
         if self.DB.pk.name not in initial:
             self.pk = None
         for field_name in self.DB.subtables:
             setattr(self, field_name, list())
         self._modified_fields_ = set(initial.keys())
 
+    @classmethod
+    def _init_fields(cls) -> tuple[dict[str, Callable[[DBFactory, Any, dict[str, Any]], Any]], frozenset[str]]:
+        # field kinds are resolved once per table, not for every value of every new instance;
+        # built lazily and dropped by `_reset_caches`, as fields and their types may change until then
+        if (res := cls.DB.init_fields) is None:
+            converters: dict[str, Callable[[DBFactory, Any, dict[str, Any]], Any]] = {}
+            for name, field in cls.DB.fields.items():
+                if inspect.isclass(field.type) and issubclass(field.type, Enum):
+                    converters[name] = lambda db, v, initial, enum_type=field.type: enum_type(v) if v is not None else None
+                elif field.ref:
+                    converters[name] = lambda db, v, initial, table=field.type, view=f'{name}__view': \
+                        DBTable.ItemGetter(db, table, v, initial.get(view))
+            names = frozenset((*cls.DB.fields, *cls.DB.many_fields, *cls.DB.many_to_many_fields))
+            res = cls.DB.init_fields = (converters, names)
+        return res
+
+    @classmethod
+    def _reset_caches(cls):
+        # anything derived from the field set and field types
+        cls.DB.sql_cache.clear()
+        cls.DB.init_fields = None
+
     def __setattr__(self, key, value):
         if key in self.DB.fields:
             if self._modified_fields_ is not None:
                 self._modified_fields_.add(key)
         return super().__setattr__(key, value)
 
+    @classmethod
+    def _hydrator(cls, db: DBFactory, columns: Sequence[str]) -> Callable[[Sequence[Any]], Self]:
+        # row values go through the same `_fill` as `__init__`, without packing keyword arguments
+        columns = tuple(columns)
+        new = object.__new__
+
+        def hydrate(values: Sequence[Any]) -> Self:
+            obj = new(cls)
+            state = obj.__dict__
+            state['_modified_fields_'] = None
+            state['_db_'] = db
+            obj._fill(dict(zip(columns, values)))
+            return obj
+
+        return hydrate
+
     @classmethod
     def check_db(cls):
         if not cls.DB.db:
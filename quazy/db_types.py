@@ -21,13 +21,13 @@ class DefaultValue:
     pass
 
 
-KNOWN_TYPES = (
+KNOWN_TYPES = frozenset((
     int, str, float, bool, bytes,
     datetime, timedelta, date, time,
     Decimal,
     UUID,
     dict,
-)
+))
 
 TYPE_MAP = {
     'int': int,
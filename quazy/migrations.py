@@ -252,6 +252,7 @@ def get_changes(db: DBFactory, schema: str, rename_list: list[tuple[str, str]] |
             field_new = fields_new[f_name]
             if inspect.isclass(field_new.type) and issubclass(field_new.type, Enum):
                 field_new.type = db_type_by_name(field_new.type.__base__.__name__)
+                table_new._reset_caches()
 
             # 4.4.1. Check flag changed
             for flag_name in ('pk','cid','prop','required','indexed','unique','default_sql'):
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from contextlib import contextmanager
-from dataclasses import dataclass
+from dataclasses import dataclass, field as data_field
 import typing
 from inspect import currentframe
 from types import SimpleNamespace
@@ -35,11 +35,13 @@ class DBQueryField:
         if not self._field:
             if self._path not in self._query.joins:
                 self._query.joins[self._path] = DBJoin(self._table, DBJoinKind.SOURCE)
+                self._query._touch()
         else:
             join_path = f'{self._table.DB.snake_name}__{self._field.name}'
             if join_path not in self._query.joins:
                 self._query.joins[join_path] = DBJoin(self._field.type, DBJoinKind.LEFT,
                                                       f'{self._path} = {join_path}.{self._field.type.DB.pk.name}')
+                self._query._touch()
             return getattr(DBQueryField(self._query, self._field.type, join_path), item)
 
         DB = self._table.DB
@@ -60,6 +62,7 @@ class DBQueryField:
             if join_path not in self._query.joins:
                 self._query.joins[join_path] = DBJoin(table, DBJoinKind.LEFT,
                                                   f'{self._path}.{DB.pk.name} = {join_path}.{DB.table}')
+                self._query._touch()
             return DBQueryField(self._query, table, join_path)
 
         raise QuazyFieldNameError(f'field `{item}` is not found in `{DB.table}`')
@@ -96,6 +99,7 @@ class DBSubqueryField:
 
         if self._path not in self._query.joins:
             self._query.joins[self._path] = DBJoin(self._subquery, DBJoinKind.SOURCE)
+            self._query._touch()
 
         if item in self._subquery.fields:
             return DBSQL(self._query, f'{self._path}.{item}')
@@ -337,6 +341,7 @@ class DBJoin:
 class DBWithClause:
     query: DBQuery
     not_materialized: bool
+    _block: Optional[tuple[Hashable, str, tuple]] = data_field(default=None, repr=False, compare=False)  # rendered block by state
 
 
 class DBScheme(SimpleNamespace):
@@ -370,8 +375,30 @@ class DBQuery(typing.Generic[T]):
         self.args: dict[str, Any] = {}
         self._arg_counter = 0
         self._hash: Optional[Hashable] = None
+        self._version = 0  # bumped on every change of the query structure
+        self._prepare = False  # has variables, so it is executed repeatedly with new values
+        self._sql: Optional[tuple[Hashable, str, tuple]] = None  # rendered SELECT by state, with the state items
         self._collect_scheme()
 
+    def _touch(self):
+        self._version += 1
+
+    def _state(self) -> tuple[Hashable, tuple]:
+        # key changes whenever the rendered SQL of this query or its WITH subqueries may change:
+        # builder calls bump the version, item ids catch direct edits of the public containers.
+        # The items are returned too, a cache holding them keeps the ids from being reused.
+        items = (*self.fields.values(), *self.joins.values(), *self.filters, *self.groups, *self.group_filters,
+                 *self.sort_list, *self.with_queries)
+        key = (self._version, self.name, self.fetch_objects, self.has_aggregates, self.window,
+               tuple(self.fields), tuple(self.joins),
+               len(self.filters), len(self.groups), len(self.group_filters), len(self.sort_list),
+               tuple(map(id, items)))
+        for sub in self.with_queries:
+            sub_key, sub_items = sub.query._state()
+            key += (sub.not_materialized, sub_key)
+            items += sub_items
+        return key, items
+
     def _collect_scheme(self, for_copy: bool = False):
         self.scheme: Union[SimpleNamespace, DBQueryField] = DBScheme()
         for table in self.db._tables:
@@ -439,13 +466,16 @@ class DBQuery(typing.Generic[T]):
             #key = list(self.args.keys())[list(self.args.values()).index(value)]
             return DBSQL(self, f'%({key})s', aggregated)
         self._arg_counter += 1
+        # stable keys keep the SQL text equal between queries of the same shape (server side prepare),
+        # the translator namespaces them only when the query is rendered as a WITH subquery
         key = f'_arg_{self._arg_counter}'
         self.args[key] = value
         return DBSQL(self, f'%({key})s', aggregated)
 
     def var(self, key: str, value: Optional[Any] = None) -> DBSQL:
         self.args[key] = value
-        return DBSQL(self, f'%({key})')
+        self._prepare = True
+        return DBSQL(self, f'%({key})s')
 
     def sql(self, expr: FDBSQL, scheme: SimpleNamespace = None) -> DBSQL:
         if callable(expr):
@@ -466,11 +496,13 @@ class DBQuery(typing.Generic[T]):
 
     def with_query(self, subquery: DBQuery, not_materialized: bool = False) -> DBSubqueryField:
         self.with_queries.append(DBWithClause(subquery, not_materialized))
+        self._touch()
         for k, v in subquery.args.items():
             if k.startswith('_arg_'):
                 self.args[f'_{subquery.name}{k}'] = v
             else:
                 self.args[k] = v
+        self._prepare |= subquery._prepare
         return DBSubqueryField(self, subquery)
 
     def select(self, *field_names: str, **fields: FDBSQL) -> DBQuery[T]:
@@ -484,16 +516,19 @@ class DBQuery(typing.Generic[T]):
             self.fields[field_name] = getattr(self.scheme, field_name)
         for field_name, field_value in fields.items():
             self.fields[field_name] = self.sql(field_value)
+        self._touch()
         return self
 
     def select_all(self) -> DBQuery[T]:
         self.fetch_objects = False
         self.fields['*'] = DBSQL(self, '*')
+        self._touch()
         return self
 
     def sort_by(self, *fields: FDBSQL, desc: bool = False) -> DBQuery[T]:
         for field in fields:
             self.sort_list.append(self.sql(field) if not desc else self.sql(field).postfix('DESC'))
+        self._touch()
         return self
 
     def filter(self, _expression: FDBSQL = None, **kwargs) -> DBQuery[T]:
@@ -503,6 +538,7 @@ class DBQuery(typing.Generic[T]):
             raise QuazyError('Query is not associated with table, cat not filter by field names')
         for k, v in kwargs.items():
             self.filters.append(getattr(self.scheme, k) == v)  # noqa
+        self._touch()
         return self
 
     def exclude(self, **kwargs) -> DBQuery[T]:
@@ -510,23 +546,28 @@ class DBQuery(typing.Generic[T]):
             raise QuazyError('Query is not associated with table, cat not filter by field names')
         for k, v in kwargs.items():
             self.filters.append(getattr(self.scheme, k) != v)  # noqa
+        self._touch()
         return self
 
     def group_filter(self, expression: FDBSQL) -> DBQuery[T]:
         self.group_filters.append(self.sql(expression))
+        self._touch()
         return self
 
     def group_by(self, *fields: FDBSQL) -> DBQuery[T]:
         for field in fields:
             self.groups.append(DBSQL(self, self.sql(field)))
+        self._touch()
         return self
 
     def set_window(self, offset: int | None = None, limit: int | None = None) -> DBQuery[T]:
         self.window = (offset, limit)
+        self._touch()
         return self
 
     def sum(self, expr: DBSQL | str | typing.Callable[[T], DBSQL]) -> DBSQL:
         self.has_aggregates = True
+        self._touch()
         expr = self.sql(expr)
         return expr.aggregate('sum')
 
@@ -536,20 +577,24 @@ class DBQuery(typing.Generic[T]):
         else:
             expr = self.sql(expr)
         self.has_aggregates = True
+        self._touch()
         return expr.aggregate('count')
 
     def avg(self, expr: FDBSQL) -> DBSQL:
         self.has_aggregates = True
+        self._touch()
         expr = self.sql(expr)
         return expr.aggregate('avg')
 
     def min(self, expr: DBSQL) -> DBSQL:
         self.has_aggregates = True
+        self._touch()
         expr = self.sql(expr)
         return expr.aggregate('min')
 
     def max(self, expr: DBSQL) -> DBSQL:
         self.has_aggregates = True
+        self._touch()
         expr = self.sql(expr)
         return expr.aggregate('max')
 
@@ -561,6 +606,7 @@ class DBQuery(typing.Generic[T]):
                 for field_name, field in self.table_class.DB.fields.items():
                     if not field.body:
                         self.fields[field_name] = getattr(self.scheme, field_name)
+                self._touch()
 
     @contextmanager
     def execute(self, as_dict: bool = False):
@@ -577,6 +623,12 @@ class DBQuery(typing.Generic[T]):
         with self.db.select(self) as rows:
             yield from rows
 
+    @contextmanager
+    def stream(self, size: int = 1000, as_dict: bool = False) -> Iterator[Iterator[T | Any]]:
+        self._check_fields()
+        with self.db.stream(self, size, as_dict) as rows:
+            yield rows
+
     def fetchone(self, as_dict: bool = False) -> T | Any:
         with self.execute(as_dict) as curr:
             return curr.fetchone()
@@ -586,6 +638,7 @@ class DBQuery(typing.Generic[T]):
             raise QuazyWrongOperation("`get` possible for objects query")
         self.filters.clear()
         self.filters.append(self.scheme.pk == pk_id)  # type: ignore
+        self._touch()
         return self.fetchone()
 
     def any(self, expr_list: typing.Iterable[DBSQL]) -> DBSQL:
@@ -617,6 +670,7 @@ class DBQuery(typing.Generic[T]):
     def fetch_aggregate(self, function: str, expr: FDBSQL = None) -> typing.Any:
         obj = self.copy()
         obj.fields.clear()
+        obj.sort_list.clear()  # single aggregated row, ordering is meaningless here
         obj.fetch_objects = False
         obj.select(result=obj.sql(expr).aggregate(function))
         return obj.fetchone().result
@@ -624,6 +678,7 @@ class DBQuery(typing.Generic[T]):
     def fetch_count(self, expr: FDBSQL = None):
         obj = self.copy()
         obj.fields.clear()
+        obj.sort_list.clear()
         obj.fetch_objects = False
         obj.select(result=obj.count(expr))
         return obj.fetchone().result
@@ -637,3 +692,6 @@ class DBQuery(typing.Generic[T]):
     def fetch_avg(self, expr: FDBSQL) -> typing.Any:
         return self.fetch_aggregate('avg', expr)
 
+    def fetch_sum(self, expr: FDBSQL) -> typing.Any:
+        return self.fetch_aggregate('sum', expr)
+
@@ -2,6 +2,15 @@ from __future__ import annotations
 
 import json
 import inspect
+from functools import lru_cache
+from operator import attrgetter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from psycopg.types.json import Jsonb
 
 from .db_types import *
 from .exceptions import *
@@ -12,8 +21,40 @@ if typing.TYPE_CHECKING:
     from . import DBTable, DBField
     from .query import DBQuery, DBSQL, DBJoinKind, DBWithClause, DBQueryField, DBSubqueryField
 
+if orjson is not None:
+    def json_dumps(value: Any) -> bytes:
+        # psycopg sends bytes as is, no need to decode
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    json_loads = orjson.loads
+else:
+    def json_dumps(value: Any) -> str:
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+    json_loads = json.loads
+
+
+def _as_is(value: Any) -> Any:
+    return value
+
+
+# DDL templates, filled with `%` formatting
+_CREATE_INDEX_TPL = 'CREATE %s INDEX IF NOT EXISTS %s_%s_index ON %s (%s)'
+_SET_DEFAULT_TPL = 'ALTER TABLE %s ALTER COLUMN %s SET DEFAULT %s'
+_ALTER_TYPE_TPL = 'ALTER TABLE %s ALTER COLUMN %s TYPE %s USING %s::%s'
+_RENAME_TABLE_TPL = 'ALTER TABLE %s RENAME TO "%s"'
+_ADD_REF_TPL = 'ALTER TABLE %s ADD CONSTRAINT fk_%s_%s FOREIGN KEY (%s) REFERENCES %s (%s) %s'
+_DROP_REF_TPL = 'ALTER TABLE %s DROP CONSTRAINT fk_%s_%s'
+_DROP_INDEX_TPL = 'DROP INDEX %s_%s_index'
+_ADD_FIELD_TPL = 'ALTER TABLE %s ADD COLUMN %s'
+_DROP_FIELD_TPL = 'ALTER TABLE %s DROP COLUMN %s'
+_RENAME_FIELD_TPL = 'ALTER TABLE %s RENAME COLUMN %s TO %s'
+_SET_NOT_NULL_TPL = 'ALTER TABLE %s ALTER COLUMN %s SET NOT NULL'
+_DROP_NOT_NULL_TPL = 'ALTER TABLE %s ALTER COLUMN %s DROP NOT NULL'
+_DROP_TABLE_TPL = 'DROP TABLE %s'
+
 
 class Translator:
+    PRETTY: bool = False  # render SELECT with line breaks and indents (for debugging)
+
     TYPES_MAP = {
         int: 'integer',
         float: 'double precision',
@@ -44,20 +85,63 @@ class Translator:
         2950: UUID,
     }
 
+    # property value to JSON body value
+    SERIALIZE_MAP = {
+        str: '{value}::text',
+        int: '{value}::text',
+        float: '{value}::text',
+        bool: '{value}::text',
+        bytes: '{value}::text',
+        UUID: '{value}::text',
+        datetime: 'CAST(extract(epoch from {value}) as integer)',
+        timedelta: 'CAST(extract(epoch from {value}) as integer)',
+        date: 'CAST(extract(epoch from {value}::timestamp) as integer)',
+        time: 'CAST(extract(epoch from {value}::timestamp) as integer)',
+    }
+
+    # JSON body value to property value
+    DESERIALIZE_MAP = {
+        str: '{path}',
+        int: 'CAST({path} as {type})',
+        float: 'CAST({path} as {type})',
+        bool: 'CAST({path} as {type})',
+        bytes: 'CAST({path} as {type})',
+        UUID: 'CAST({path} as {type})',
+        datetime: 'to_timestamp(({path})::integer)',
+        date: 'date(to_timestamp({path}))',
+        time: 'to_timestamp(({path})::integer)::time',
+        timedelta: "({path} || ' seconds')::interval",
+    }
+
     @classmethod
     def type_name(cls, field: DBField, primary: bool = True) -> str:
         if field.pk and primary:
             return cls.pk_type_name(field.type)
-        if field.type in cls.TYPES_MAP:
-            return cls.TYPES_MAP[field.type]
-        if inspect.isclass(field.type) and issubclass(field.type, Enum):
-            return cls.TYPES_MAP[field.type.__bases__[0]]
-        # TODO: Decimal
-        # TODO: array
         if field.ref:
-            return cls.type_name(field.type.DB.pk, False)
+            return cls._ref_type_name(field.type)
+        if (res := cls._type_name(field.type)) is not None:
+            return res
         raise QuazyTranslatorException(f'Unsupported DB column type {field.name} ({field.type})')
 
+    @classmethod
+    def _ref_type_name(cls, ref_table: type[DBTable]) -> str:
+        # cached with the referenced table, so it follows its pk after `_reset_caches`
+        cache = ref_table.DB.sql_cache
+        if (res := cache.get(key := ('ref_type', cls))) is None:
+            res = cache[key] = cls.type_name(ref_table.DB.pk, False)
+        return res
+
+    @classmethod
+    @lru_cache(maxsize=256)
+    def _type_name(cls, field_type: type) -> str | None:
+        if field_type in cls.TYPES_MAP:
+            return cls.TYPES_MAP[field_type]
+        if inspect.isclass(field_type) and issubclass(field_type, Enum):
+            return cls.TYPES_MAP[field_type.__bases__[0]]
+        # TODO: Decimal
+        # TODO: array
+        return None
+
     @classmethod
     def type_cast(cls, field: DBField) -> str:
         if field.type in cls.TYPES_MAP:
@@ -68,37 +152,32 @@ class Translator:
 
     @classmethod
     def serialize(cls, field: DBField, value: str) -> str:
-        #if field.type is str:
-        #    return value
-        if field.type in (str, int, float, bool, bytes, UUID):
-            return f'{value}::text'
         if field.ref:
             return cls.serialize(field.type.DB.pk, value)
-        if field.type in (datetime, timedelta):
-            return f'CAST(extract(epoch from {value}) as integer)'
-        if field.type in (date, time):
-            return f'CAST(extract(epoch from {value}::timestamp) as integer)'
-        raise QuazyFieldTypeError(f'Type `{field.type.__name__}` is not supported for serialization')
+        return cls._serialize(field.type, value)
+
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def _serialize(cls, field_type: type, value: str) -> str:
+        if (template := cls.SERIALIZE_MAP.get(field_type)) is not None:
+            return template.format(value=value)
+        raise QuazyFieldTypeError(f'Type `{field_type.__name__}` is not supported for serialization')
 
     @classmethod
     def deserialize(cls, field: DBField, field_path: str) -> str:
-        if field.type is str:
-            return field_path
-        if field.type in (int, float, bool, bytes, UUID):
-            return f'CAST({field_path} as {cls.type_cast(field)})'
         if field.ref:
             return cls.deserialize(field.type.DB.pk, field_path)
-        if field.type is datetime:
-            return f'to_timestamp(({field_path})::integer)'
-        if field.type is date:
-            return f'date(to_timestamp({field_path}))'
-        if field.type is time:
-            return f'to_timestamp(({field_path})::integer)::time'
-        if field.type is timedelta:
-            return f"({field_path} || ' seconds')::interval"
-        raise QuazyFieldTypeError(f'Type `{field.type.__name__}` is not supported for serialization')
+        return cls._deserialize(field.type, field_path)
+
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def _deserialize(cls, field_type: type, field_path: str) -> str:
+        if (template := cls.DESERIALIZE_MAP.get(field_type)) is not None:
+            return template.format(path=field_path, type=cls.TYPES_MAP[field_type])
+        raise QuazyFieldTypeError(f'Type `{field_type.__name__}` is not supported for serialization')
 
     @classmethod
+    @lru_cache(maxsize=16)
     def pk_type_name(cls, ctype: type) -> str:
         if ctype is int:
             return 'serial'
@@ -108,28 +187,37 @@ class Translator:
 
     @classmethod
     def column_options(cls, field: DBField, table: type[DBTable]) -> str:
-        res: list[str] = []
-        if field.unique:
-            res.append('UNIQUE')
-        if field.required and not table.DB.extendable:
-            res.append('NOT NULL')
-        if field.default_sql:
-            res.append(f'DEFAULT {field.default_sql}')
-        if field.pk:
-            res.append('PRIMARY KEY')
-            if field.type is UUID:
-                res.append('DEFAULT gen_random_uuid()')
-        return ' '.join(res)
+        return cls._column_options(field.unique, field.required and not table.DB.extendable, field.default_sql,
+                                   field.pk, field.type is UUID)
+
+    @classmethod
+    @lru_cache(maxsize=256)
+    def _column_options(cls, unique: bool, not_null: bool, default_sql: str | None, pk: bool, uuid: bool) -> str:
+        res = 'UNIQUE' if unique else ''
+        if not_null:
+            res = f'{res} NOT NULL' if res else 'NOT NULL'
+        if default_sql:
+            res = f'{res} DEFAULT {default_sql}' if res else f'DEFAULT {default_sql}'
+        if pk:
+            res = f'{res} PRIMARY KEY' if res else 'PRIMARY KEY'
+            if uuid:
+                res += ' DEFAULT gen_random_uuid()'
+        return res
+
+    @classmethod
+    def column_definition(cls, field: DBField, table: type[DBTable]) -> str:
+        return f'{field._qcol} {cls.type_name(field)} {cls.column_options(field, table)}'
 
     @classmethod
     def table_name(cls, table: type[DBTable]) -> str:
-        schema = table.DB.schema + '"."' if table.DB.schema else ''
-        return f'"{schema}{table.DB.table}"'
+        return cls.table_name2(table.DB.schema, table.DB.table)
 
     @classmethod
+    @lru_cache(maxsize=1024)
     def table_name2(cls, schema: str, table_name: str) -> str:
-        schema =  schema + '"."' if schema else ''
-        return f'"{schema}{table_name}"'
+        if not schema:
+            return f'"{table_name}"'
+        return f'"{schema}"."{table_name}"'
 
     @classmethod
     def subquery_name(cls, subquery: DBQuery) -> str:
@@ -138,17 +226,15 @@ class Translator:
     @classmethod
     def create_index(cls, table: type[DBTable], field: DBField) -> str:
         unique = 'UNIQUE' if field.unique else ''
-        return f'CREATE {unique} INDEX IF NOT EXISTS {table.DB.table}_{field.column}_index ON {cls.table_name(table)} ("{field.column}")'
+        return _CREATE_INDEX_TPL % (unique, table.DB.table, field.column, cls.table_name(table), field._qcol)
 
     @classmethod
     def drop_index(cls, table: type[DBTable], field: DBField) -> str:
-        res = f'DROP INDEX {table.DB.table}_{field.column}_index'
-        return res
+        return _DROP_INDEX_TPL % (table.DB.table, field.column)
 
     @classmethod
     def set_default_value(cls, table: type[DBTable], field: DBField, sql_value: str) -> str:
-        res = f'ALTER TABLE {cls.table_name(table)} ALTER COLUMN {field.column} SET DEFAULT {sql_value}'
-        return res
+        return _SET_DEFAULT_TPL % (cls.table_name(table), field._qcol, sql_value)
 
     @classmethod
     def create_schema(cls, name: str):
@@ -156,45 +242,39 @@ class Translator:
 
     @classmethod
     def create_table(cls, table: type[DBTable]) -> str:
-        cols = ', '.join(
-            f'"{field.column}" {cls.type_name(field)} {cls.column_options(field, table)}'
+        column_definition = cls.column_definition
+        cols = ', '.join([
+            column_definition(field, table)
             for field in table.DB.fields.values()
             #if not field.many_field and not field.prop
             if not field.prop
-        )
-        res = f'CREATE TABLE {cls.table_name(table)} ({cols})'
-        return res
+        ])
+        return f'CREATE TABLE {cls.table_name(table)} ({cols})'
 
     @classmethod
     def add_field(cls, table: type[DBTable], field: DBField):
-        col = f'"{field.column}" {cls.type_name(field)} {cls.column_options(field, table)}'
-        res = f'ALTER TABLE {cls.table_name(table)} ADD COLUMN {col}'
-        return res
+        return _ADD_FIELD_TPL % (cls.table_name(table), cls.column_definition(field, table))
 
     @classmethod
     def drop_field(cls, table: type[DBTable], field: DBField):
-        res = f'ALTER TABLE {cls.table_name(table)} DROP COLUMN {field.column}'
-        return res
+        return _DROP_FIELD_TPL % (cls.table_name(table), field._qcol)
 
     @classmethod
     def rename_field(cls, table: type[DBTable], old_name: str, new_name: str):
-        res = f'ALTER TABLE {cls.table_name(table)} RENAME COLUMN {old_name} TO {new_name}'
-        return res
+        return _RENAME_FIELD_TPL % (cls.table_name(table), old_name, new_name)
 
     @classmethod
     def alter_field_type(cls, table: type[DBTable], field: DBField):
-        res = f'ALTER TABLE {cls.table_name(table)} ALTER COLUMN {field.column} TYPE {cls.type_name(field)} USING {field.column}::{cls.type_name(field)}'
-        return res
+        type_name = cls.type_name(field)
+        return _ALTER_TYPE_TPL % (cls.table_name(table), field._qcol, type_name, field._qcol, type_name)
 
     @classmethod
     def drop_table(cls, table: type[DBTable]) -> str:
-        res = f'DROP TABLE {cls.table_name(table)}'
-        return res
+        return _DROP_TABLE_TPL % cls.table_name(table)
 
     @classmethod
     def rename_table(cls, schema: str, old_table_name: str, new_table_name: str) -> str:
-        res = f"ALTER TABLE {cls.table_name2(schema, old_table_name)} RENAME TO \"{new_table_name}\""
-        return res
+        return _RENAME_TABLE_TPL % (cls.table_name2(schema, old_table_name), new_table_name)
 
     @classmethod
     def add_reference(cls, table: type[DBTable], field: DBField) -> str:
@@ -204,100 +284,173 @@ class Translator:
             actions = 'ON DELETE CASCADE'
         else:
             actions = 'ON DELETE SET NULL'
-        res = f'ALTER TABLE {cls.table_name(table)} ADD CONSTRAINT fk_{table.DB.table}_{field.column} FOREIGN KEY ("{field.column}") REFERENCES {cls.table_name(field.type)} ("{field.type.DB.pk.column}") {actions}'
-        return res
+        return _ADD_REF_TPL % (cls.table_name(table), table.DB.table, field.column, field._qcol,
+                               cls.table_name(field.type), field.type.DB.pk._qcol, actions)
 
     @classmethod
     def drop_reference(cls, table: type[DBTable], field: DBField) -> str:
         if not field.ref:
             raise QuazyTranslatorException(f'Field {field.name} is not reference')
-        res = f'ALTER TABLE {cls.table_name(table)} DROP CONSTRAINT fk_{table.DB.table}_{field.column}'
-        return res
+        return _DROP_REF_TPL % (cls.table_name(table), table.DB.table, field.column)
 
     @classmethod
     def set_not_null(cls, table: type[DBTable], field: DBField) -> str:
-        res = f'ALTER TABLE {cls.table_name(table)} ALTER COLUMN {field.column} SET NOT NULL'
-        return res
+        return _SET_NOT_NULL_TPL % (cls.table_name(table), field._qcol)
 
     @classmethod
     def drop_not_null(cls, table: type[DBTable], field: DBField) -> str:
-        res = f'ALTER TABLE {cls.table_name(table)} ALTER COLUMN {field.column} DROP NOT NULL'
-        return res
+        return _DROP_NOT_NULL_TPL % (cls.table_name(table), field._qcol)
 
     @classmethod
     def get_value(cls, field: DBField, value: Any) -> Any:
-        if field.type is dict:
-            return json.dumps(value)
         if field.ref:
-            return getattr(value, field.type.DB.pk.name)
-        if issubclass(field.type, IntEnum):
-            return value.value
-        return value
+            return cls._ref_converter(field.type)(value)
+        return cls._value_converter(field.type)(value)
 
     @classmethod
-    def insert(cls, table: type[DBTable], fields: list[tuple[DBField, Any]]) -> tuple[str, dict[str, Any]]:
+    def _ref_converter(cls, ref_table: type[DBTable]) -> Callable[[Any], Any]:
+        # cached with the referenced table, so it follows its pk after `_reset_caches`
+        cache = ref_table.DB.sql_cache
+        if (res := cache.get(key := ('ref_value', ))) is not None:
+            return res
+        from .db_table import DBTable
+        pk_name = ref_table.DB.pk.name
+        item_getter = DBTable.ItemGetter
+
+        def ref_value(value: Any) -> Any:
+            if isinstance(value, item_getter):  # lazy reference, don't load it just for the key
+                value = value._pk_id
+            if isinstance(value, DBTable):
+                return getattr(value, pk_name)
+            return value
+        cache[key] = ref_value
+        return ref_value
+
+    @classmethod
+    @lru_cache(maxsize=256)
+    def _value_converter(cls, field_type: type) -> Callable[[Any], Any]:
+        # python value to query parameter, picked once per field type
+        if field_type is dict:
+            return lambda value: Jsonb(value, json_dumps)
+        if inspect.isclass(field_type) and issubclass(field_type, IntEnum):
+            return attrgetter('value')
+        return _as_is
+
+    @classmethod
+    @lru_cache(maxsize=256)
+    def body_template(cls, names: tuple[str, ...]) -> str:
+        # `json_build_object` call with a `{}` slot per property value
+        pairs = ', '.join(f"'{name}',{{}}" for name in names)
+        return f'json_build_object({pairs})'
+
+    @classmethod
+    def insert(cls, table: type[DBTable], fields: list[tuple[DBField, Any]]) -> tuple[str, tuple[Any, ...]]:
+        # positional values: columns first, then body properties, in the order of `_insert_sql` placeholders
+        values: list[Any] = []
+        prop_values: list[Any] = []
+        shape: list[tuple[DBField, str]] = []
+        get_value = cls.get_value
+        has_body = table.DB.body is not None
+        for field, value in fields:
+            if not field.prop and (field.default_sql or field.body):
+                continue
+            if field.prop and field.default_sql:
+                mark = 'sql'
+            elif field.pk and not field.prop or value is DefaultValue and field.default is None:
+                mark = 'default'
+            else:
+                if value is not DefaultValue:
+                    value = get_value(field, value)
+                elif not callable(field.default):
+                    value = field.default
+                else:
+                    value = field.default()
+                if not field.prop:
+                    values.append(value)
+                elif has_body:
+                    prop_values.append(value)
+                mark = 'arg'
+            shape.append((field, mark))
+
+        # the statement text depends on the shape only, reuse it so psycopg can prepare it;
+        # cached on the table itself, keyed by everything the text is rendered from
+        cache = table.DB.sql_cache
+        shape_key = ('insert', cls, table.DB.schema, tuple((field.name, field.column, field.type, mark) for field, mark in shape))
+        if (res := cache.get(shape_key)) is None:
+            res = cache[shape_key] = cls._insert_sql(table, shape)
+        return res, (*values, *prop_values)
+
+    @classmethod
+    def copy(cls, table: type[DBTable], fields: list[tuple[DBField, Any]]) -> tuple[str, tuple[Any, ...]]:
+        # COPY can't evaluate defaults or build the body, so only plain column values are sent
+        if table.DB.body is not None:
+            raise QuazyNotSupported(f'COPY is not supported for table `{table.DB.table}` with body')
+        values: list[Any] = []
+        columns: list[str] = []
+        get_value = cls.get_value
+        for field, value in fields:
+            if field.pk or field.default_sql or field.body or value is DefaultValue and field.default is None:
+                continue
+            if value is not DefaultValue:
+                value = get_value(field, value)
+            elif not callable(field.default):
+                value = field.default
+            else:
+                value = field.default()
+            columns.append(field._qcol)
+            values.append(value)
+
+        cache = table.DB.sql_cache
+        key = ('copy', cls, table.DB.schema, tuple(columns))
+        if (res := cache.get(key)) is None:
+            res = cache[key] = f'COPY {cls.table_name(table)} ({",".join(columns)}) FROM STDIN'
+        return res, tuple(values)
+
+    @classmethod
+    def insert_bulk(cls, table: type[DBTable], rows: list[list[tuple[DBField, Any]]]) -> list[tuple[str, list[int], list[tuple[Any, ...]]]]:
+        # rows of the same shape share one statement, so they can go to the server in a single batch
+        batches: dict[str, tuple[list[int], list[tuple[Any, ...]]]] = {}
+        insert = cls.insert
+        for i, fields in enumerate(rows):
+            sql, values = insert(table, fields)
+            if (batch := batches.get(sql)) is None:
+                batch = batches[sql] = ([], [])
+            batch[0].append(i)
+            batch[1].append(values)
+        return [(sql, indices, values) for sql, (indices, values) in batches.items()]
+
+    @classmethod
+    def _insert_sql(cls, table: type[DBTable], shape: list[tuple[DBField, str]]) -> str:
         sql_values: list[str] = []
-        values: dict[str, Any] = {}
         body_values: dict[str, Any] = {}
-        idx = 1
-        for field, value in fields:
+        for field, mark in shape:
             if not field.prop:  # attr
-                if field.default_sql or field.body:
-                    continue
-                if field.pk:
-                    sql_values.append('DEFAULT')
-                elif value is DefaultValue:
-                    if field.default is None:
-                        sql_values.append('DEFAULT')
-                    else:
-                        sql_values.append(f'%(v{idx})s')
-                        if not callable(field.default):
-                            values[f'v{idx}'] = field.default
-                        else:
-                            values[f'v{idx}'] = field.default()
-                        idx += 1
-                else:
-                    sql_values.append(f'%(v{idx})s')
-                    values[f'v{idx}'] = cls.get_value(field, value)
-                    idx += 1
-
+                sql_values.append('%s' if mark == 'arg' else 'DEFAULT')
             else:  # prop
-                if field.default_sql:
+                if mark == 'sql':
                     body_values[field.name] = field.default_sql
-                elif value is DefaultValue:
-                    if field.default in None:
-                        body_values[field.name] = 'null'
-                    else:
-                        body_values[field.name] = cls.serialize(field, f'%(v{idx})s')
-                        if not callable(field.default):
-                            values[f'v{idx}'] = field.default
-                        else:
-                            values[f'v{idx}'] = field.default()
-                        idx += 1
+                elif mark == 'default':
+                    body_values[field.name] = 'null'
                 else:
-                    body_values[field.name] = cls.serialize(field, f'%(v{idx})s')
-                    values[f'v{idx}'] = cls.get_value(field, value)
-                    idx += 1
+                    body_values[field.name] = cls.serialize(field, '%s')
 
         #columns = ','.join(f'"{field.column}"' for field, _ in fields if not field.many_field)
-        columns = ','.join(f'"{field.column}"' for field, _ in fields if not field.default_sql and not field.prop and not field.body)
+        columns = ','.join(field._qcol for field, _ in shape if not field.prop)
         row = ','.join(sql_values)
 
         if table.DB.body:
             if columns:
                 columns += ','
-            columns += f'"{table.DB.body.column}"'
+            columns += table.DB.body._qcol
             if body_values:
-                body_value = ', '.join(f"'{name}',{value}" for name, value in body_values.items())
-                body_value = f'json_build_object({body_value})'
+                body_value = cls.body_template(tuple(body_values)).format(*body_values.values())
             else:
                 body_value = "'{}'::jsonb"
             if row:
                 row += ','
             row += body_value
 
-        res = f'INSERT INTO {cls.table_name(table)} ({columns}) VALUES ({row}) RETURNING "{table.DB.pk.column}"'
-        return res, values
+        return f'INSERT INTO {cls.table_name(table)} ({columns}) VALUES ({row}) RETURNING {table.DB.pk._qcol}'
 
     @classmethod
     def clear(cls, table: type[DBTable]) -> str:
@@ -308,123 +461,152 @@ class Translator:
         return f'DELETE FROM {cls.table_name(table)} WHERE "{column}" = %s'
 
     @classmethod
-    def update(cls, table: type[DBTable], fields: list[tuple[DBField, Any]]) -> tuple[str, dict[str, Any]]:
-        sql_values: list[str] = []
-        values: dict[str, Any] = {}
-        idx = 2
-        #filtered = [f for f in fields if not f[0].many_field and not f[0].pk]
-        filtered = [f for f in fields if not f[0].pk]
-        for field, value in filtered:
-            sql_values.append(f'%(v{idx})s')
-            values[f'v{idx}'] = cls.get_value(field, value)
-            idx += 1
+    def update(cls, table: type[DBTable], fields: list[tuple[DBField, Any]]) -> tuple[str, list[Any]]:
+        # positional values: columns first, then body properties; the primary key value goes last
+        values: list[Any] = []
+        prop_values: list[Any] = []
+        get_value = cls.get_value
+        has_body = table.DB.body is not None
+        for field, value in fields:
+            if field.pk:
+                continue
+            if not field.prop:
+                values.append(get_value(field, value))
+            elif has_body:
+                prop_values.append(get_value(field, value))
+        values += prop_values
+
+        # the statement text depends on the updated fields only
+        cache = table.DB.sql_cache
+        key = ('update', cls, table.DB.schema, tuple((field.name, field.column, field.type) for field, _ in fields))
+        if (res := cache.get(key)) is None:
+            res = cache[key] = cls._update_sql(table, [field for field, _ in fields])
+        return res, values
 
+    @classmethod
+    def _update_sql(cls, table: type[DBTable], fields: list[DBField]) -> str:
         sets: list[str] = []
         props: list[str] = []
-        for field, sql_value in zip(filtered, sql_values):
-            if not field[0].prop:
-                sets.append(f'"{field[0].column}" = {sql_value}')
-            else:
-                props.append("'{}',{}".format(field[0].column, cls.serialize(field[0], sql_value)))
-
+        serialize = cls.serialize
+        body = table.DB.body
+        for field in fields:
+            if field.pk:
+                continue
+            if not field.prop:
+                sets.append(f'{field._qcol} = %s')
+            elif body is not None:
+                props.append(f"'{field.column}',{serialize(field, '%s')}")
+
+        if props:
+            body_column = body._qcol
+            sets.append(f'{body_column} = {body_column} || jsonb_build_object({", ".join(props)})')
         sets_sql = ', '.join(sets)
-        if table.DB.body and props:
-            if sets_sql:
-                sets_sql += ', '
-            body_value = ', '.join(props)
-            sets_sql += f'"{table.DB.body.column}" = "{table.DB.body.column}" || json_build_object({body_value})'
 
-        res = f'UPDATE {cls.table_name(table)} SET {sets_sql} WHERE "{table.DB.pk.column}" = %(v1)s'
-        return res, values
+        return f'UPDATE {cls.table_name(table)} SET {sets_sql} WHERE {table.DB.pk._qcol} = %s'
 
     @classmethod
     def sql_value(cls, value: Union[DBSQL, DBQueryField, str]) -> str:
         from .query import DBSQL, DBQueryField
+        # both keep their rendered text, read it directly instead of going through repr()/str()
         if isinstance(value, DBSQL):
-            return repr(value)
+            return value.sql_text
         elif isinstance(value, DBQueryField):
-            return str(value)
+            return value._path
         return value #.replace("'", "''")
 
     @classmethod
     def with_select(cls, with_queries: list[DBWithClause]):
-        sql = "WITH\n"
+        nl = '\n' if cls.PRETTY else ' '
         with_blocks = []
         for sub in with_queries:
-            render = cls.select(sub.query)
-            render = render.replace('%(_arg_', f'%(_{cls.subquery_name(sub.query)}_arg_')
-            block = f'{cls.subquery_name(sub.query)} AS {"NOT MATERIALIZED" if sub.not_materialized else ""} (\n{render})\n'
+            # subqueries rarely change between executions, reuse the block until the subquery is modified
+            state, items = sub.query._state()
+            key = (cls, cls.PRETTY, sub.not_materialized, state)
+            if sub._block is not None and sub._block[0] == key:
+                with_blocks.append(sub._block[1])
+                continue
+            name = cls.subquery_name(sub.query)
+            render = cls.select(sub.query, arg_ns=f'_{name}')
+            materialized = 'NOT MATERIALIZED ' if sub.not_materialized else ''
+            block = f'{name} AS {materialized}({nl}{render}){nl}'
+            sub._block = (key, block, items)
             with_blocks.append(block)
-        sql += ',\n'.join(with_blocks)
-        return sql
+        return ''.join((f'WITH{nl}', f',{nl}'.join(with_blocks)))
 
     @classmethod
-    def select(cls, query: DBQuery) -> str:
+    def select(cls, query: DBQuery, arg_ns: str = '') -> str:
         from .query import DBJoinKind, DBQueryField
-        from .db_table import DBTable
 
-        sql = ''
+        # reused queries are rendered once until their structure changes
+        state, items = query._state()
+        key = (cls, cls.PRETTY, arg_ns, state)
+        if query._sql is not None and query._sql[0] == key:
+            return query._sql[1]
+
+        if cls.PRETTY:
+            nl, tab, comma = '\n', '\n\t', ',\n\t'
+        else:
+            nl, tab, comma = ' ', ' ', ','
+
+        # bind hot classmethods once, instead of resolving descriptors per item
+        sql_value = cls.sql_value
+        table_name = cls.table_name
+
+        parts: list[str] = []
         if query.with_queries:
-            sql += cls.with_select(query.with_queries)
+            parts.append(cls.with_select(query.with_queries))
 
-        sql += 'SELECT\n'
         fields = []
         for field, value in query.fields.items():
-            fields.append(f'{cls.sql_value(value)} AS "{field}"') if field != '*' else fields.append(cls.sql_value(value))
+            fields.append(f'{sql_value(value)} AS "{field}"') if field != '*' else fields.append(sql_value(value))
             if isinstance(value, DBQueryField):
                 view = value._field.type._view(value)
                 if view is not None:
                     fields.append(f'{view} AS "{field}__view"')
         joins = []
         for join_name, join in query.joins.items():
-            if join.kind == DBJoinKind.SOURCE:
+            if join.kind is DBJoinKind.SOURCE:
                 op = 'FROM'
             else:
                 op = f'{join.kind.value} JOIN'
-            if inspect.isclass(join.source) and issubclass(join.source, DBTable):
-                joins.append(f'{op} {cls.table_name(join.source)} AS "{join_name}"' + (f'\n\tON {cls.sql_value(join.condition)}' if join.condition else ''))
+            # join source is either a table class or a subquery instance
+            if isinstance(join.source, type):
+                joins.append(f'{op} {table_name(join.source)} AS "{join_name}"' + (f'{tab}ON {sql_value(join.condition)}' if join.condition else ''))
             else:
                 joins.append(f'{op} {cls.subquery_name(join.source)}')
-        filters = []
-        group_filters = []
-        for filter in query.filters:
-            if not filter.aggregated:
-                filters.append(cls.sql_value(filter))
-            else:
-                group_filters.append(cls.sql_value(filter))
-        for group_filter in query.group_filters:
-            group_filters.append(cls.sql_value(group_filter))
-        groups = []
-        for group in query.groups:
-            groups.append(cls.sql_value(group))
+        filters = [sql_value(filter) for filter in query.filters if not filter.aggregated]
+        group_filters = [sql_value(filter) for filter in query.filters if filter.aggregated]
+        group_filters += [sql_value(group_filter) for group_filter in query.group_filters]
+        groups = [sql_value(group) for group in query.groups]
         if not groups and query.has_aggregates:
-            for n, field in enumerate(query.fields.values()):
-                if not field.aggregated:
-                    groups.append(f'{n+1}')
-        orders = []
-        for order in query.sort_list:
-            orders.append(cls.sql_value(order))
+            groups = [str(n) for n, field in enumerate(query.fields.values(), 1) if not field.aggregated]
+        orders = [sql_value(order) for order in query.sort_list]
 
         if not fields:
             raise QuazyTranslatorException('No fields selected')
 
-        sql += '\t' + ',\n\t'.join(fields) + '\n'
-        sql += '\n'.join(joins) + '\n'
+        parts += ('SELECT', tab, comma.join(fields), nl, nl.join(joins), nl)
         if filters:
-            sql += 'WHERE\n\t' + '\n\tAND '.join(filters) + '\n'
+            parts += ('WHERE', tab, f'{tab}AND '.join(filters), nl)
         if groups:
-            sql += 'GROUP BY\n\t' + '\n\t'.join(groups) + '\n'
-            if group_filters:
-                sql += 'HAVING\n\t' + '\n\tAND '.join(group_filters) + '\n'
+            parts += ('GROUP BY', tab, comma.join(groups), nl)
+        # aggregate conditions go to HAVING even for a single aggregated row, otherwise they would be lost
+        if group_filters:
+            parts += ('HAVING', tab, f'{tab}AND '.join(group_filters), nl)
         if orders:
-            sql += 'ORDER BY\n\t' + '\n\t'.join(orders) + '\n'
+            parts += ('ORDER BY', tab, comma.join(orders), nl)
 
         if query.window[0] is not None:
-            sql += f'OFFSET {query.window[0]}\n'
+            parts += (f'OFFSET {query.window[0]}', nl)
         if query.window[1] is not None:
-            sql += f'LIMIT {query.window[1]}\n'
+            parts += (f'LIMIT {query.window[1]}', nl)
 
         # sql = sql % dict((key, f'%({key})s') for key in query.args.keys())
+        sql = ''.join(parts)
+        if arg_ns:
+            # own arguments of a WITH subquery are merged into the parent under the namespace
+            sql = sql.replace('%(_arg_', f'%({arg_ns}_arg_')
+        query._sql = (key, sql, items)
         return sql
 
     @classmethod
@@ -433,14 +615,16 @@ class Translator:
 
     @classmethod
     def delete_selected(cls, query: DBQuery, subquery: DBSubqueryField) -> str:
-        sql = ''
+        parts: list[str] = []
         if query.with_queries:
-            sql += cls.with_select(query.with_queries)
+            parts.append(cls.with_select(query.with_queries))
 
-        sql += f'''DELETE FROM {cls.table_name(query.table_class)} USING "{subquery._path}"
-        WHERE {cls.table_name(query.table_class)}."{query.table_class.DB.pk.name}" = "{subquery._path}"."{query.table_class.DB.pk.name}"'''
+        table_name = cls.table_name(query.table_class)
+        pk = query.table_class.DB.pk
+        parts.append(f'''DELETE FROM {table_name} USING "{subquery._path}"
+        WHERE {table_name}.{pk._qcol} = "{subquery._path}"."{pk.name}"''')
 
-        return sql
+        return ''.join(parts)
 
     @classmethod
     def select_all_tables(cls) -> str:
@@ -462,26 +646,38 @@ class Translator:
         )"""
 
     @classmethod
+    @lru_cache(maxsize=512)
     def select_many_indices(cls, middle_table: type[DBTable], primary_index: str, secondary_index: str) -> str:
         return f'''SELECT array_agg("{secondary_index}") FROM
             {cls.table_name(middle_table)}
         WHERE
-            "{primary_index}" = %(value)s
+            "{primary_index}" = %s
+        '''
+
+    @classmethod
+    @lru_cache(maxsize=512)
+    def select_many_links(cls, middle_table: type[DBTable], primary_index: str, secondary_index: str) -> str:
+        return f'''SELECT "{primary_index}", "{secondary_index}" FROM
+            {cls.table_name(middle_table)}
+        WHERE
+            "{primary_index}" = ANY(%s)
         '''
 
     @classmethod
+    @lru_cache(maxsize=512)
     def delete_many_indices(cls, middle_table: type[DBTable], primary_index: str, secondary_index: str) -> str:
         return f'''DELETE FROM
             {cls.table_name(middle_table)}
         WHERE
-            "{primary_index}" = %(value)s AND
-            "{secondary_index}" in %(indices)s
+            "{primary_index}" = %s AND
+            "{secondary_index}" = ANY(%s)
         '''
 
     @classmethod
+    @lru_cache(maxsize=512)
     def insert_many_index(cls, middle_table: type[DBTable], primary_index: str, secondary_index: str) -> str:
         return f'''INSERT INTO
             {cls.table_name(middle_table)} ("{primary_index}", "{secondary_index}")
         VALUES
-            (%(value)s, %(index)s)
+            (%s, %s)
         '''
@@ -140,6 +140,12 @@ if __name__ == '__main__':
     novoross = City(name='Novorossiysk')
     db.insert(novoross)
 
+    city_query = db.query(City)
+    city_query.filter(lambda s: s.name == city_query.var('name'))
+    for name in ('Krasnodar', 'Novorossiysk'):
+        city_query.args['name'] = name
+        print(city_query.fetchone())
+
     qty = Unit(name='qty', weight=1)
     db.insert(qty)
     pack = Unit(name='pack', weight=10)
@@ -159,27 +165,42 @@ if __name__ == '__main__':
     db.update(potato)
 
     day1 = datetime.now() - timedelta(days=30)
-    for i in range(10):
-        sell = Sale(date=day1, number=str(i), client=buyer)
+    dates = [day1 + timedelta(days=i) for i in range(10)]
+    sales = []
+    for i, date in enumerate(dates):
+        sell = Sale(date=date, number=str(i), client=buyer)
         for k in range(3):
             sell.rows.append(Sale.Row(item=potato, unit=pack, qty=randint(10,100)))
-        day1 += timedelta(days=1)
-        db.insert(sell)
+        sales.append(sell)
+    db.insert_many(sales)
+
+    cutoff = day1 + timedelta(days=5)
 
     with db.query() as q, q.get_scheme() as s:
         q.reuse()
         q.select(date=s.sales.date, date_sum=q.sum(s.sales.rows.qty * s.sales.rows.unit.weight))
         q.sort_by(2)
-        q.filter(s.sales.date >= day1 - timedelta(days=5))
+        q.filter(s.sales.date >= cutoff)
         q.filter(q.fields['date_sum'] > 80)
     with db.select(q) as res:
         for row in res:
             print(row)
     #print(res)
 
+    with db.query(Sale).sort_by('number').stream(size=4) as stream:
+        print([sale.number for sale in stream])
+
     cnt_test = db.query(Sale).fetch_count()
     print(cnt_test)
 
+    print(db.query(Sale.Row).filter(sale=sales[0]).sort_by('qty').fetch_sum(lambda s: s.qty))
+
+    with db.query() as q3, q3.get_scheme() as s:
+        q3.select(total=q3.sum(s.sales.rows.qty))
+        q3.filter(s.sales.date >= cutoff)
+        q3.filter(q3.fields['total'] > 100)
+    print(q3.fetchone())
+
     with db.query() as q2:
         sub = q2.with_query(q)
         q2.select(total_max=q2.max(sub.date_sum))
@@ -195,10 +216,14 @@ if __name__ == '__main__':
     user = User(name="zergos", apps=list(App(name=f'app{i+1}') for i in range(10)))
     db.insert(user)
 
-    for i in range(10):
-        db.insert(ItemCatalog(name=f'Item{i+1}', unit=qty))
-    for i in range(10):
-        db.insert(GroupCatalog(name=f'Group{i+1}'))
+    users = db.prefetch(db.query(User).fetchall(), 'apps')
+    print([app.name for app in users[0].apps])
+
+    cities = db.prefetch(db.query(City).fetchall(), 'clients', 'fact_clients')
+    print({city.name: [client.name for client in city.fact_clients] for city in cities})
+
+    db.insert_many(ItemCatalog(name=f'Item{i+1}', unit=qty) for i in range(10))
+    db.insert_many(GroupCatalog(name=f'Group{i+1}') for i in range(10))
 
     print(db.query(GroupCatalog).select('name').fetchlist())
 
@@ -213,12 +238,7 @@ if __name__ == '__main__':
     with open("test_quazy.pyi", "wt") as f:
         f.write(gen_stub(db))
 
-    for i in range(20):
-        if i%2==0:
-            unit = qty
-        else:
-            unit = pack
-        db.insert(Item(name=f"Item{i}", base_unit=unit))
+    db.insert_many(Item(name=f"Item{i}", base_unit=qty if i%2==0 else pack) for i in range(20))
 
     db.delete(Item, filter=lambda x: x.base_unit == qty)
 
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import unittest
+from enum import IntEnum
+
+from quazy import DBFactory, DBTable, DBField
+from quazy.exceptions import QuazyFieldNameError
+from quazy.translator import Translator
+
+
+class Shop(DBTable):
+    _schema_ = 'offline'
+    name: str
+
+
+class Goods(DBTable):
+    class Kind(IntEnum):
+        FOOD = 1
+        TOOL = 2
+
+    _schema_ = 'offline'
+    name: str
+    price: float
+    shop: Shop
+    kind: Goods.Kind
+
+
+db = DBFactory(None)
+db.use_module(__name__)
+
+
+class FieldTests(unittest.TestCase):
+
+    def test_quoted_column_follows_rename(self):
+        field = DBField()
+        field.prepare('title')
+        self.assertEqual(field._qcol, '"title"')
+        field.column = 'caption'
+        self.assertEqual(field._qcol, '"caption"')
+
+    def test_quoted_column_of_explicit_column(self):
+        field = DBField('caption')
+        field.prepare('title')
+        self.assertEqual(field._qcol, '"caption"')
+        self.assertIn('_qcol', vars(field))
+
+    def test_renamed_column_in_dml(self):
+        field = Goods.DB.fields['price']
+        try:
+            field.column = 'cost'
+            sql, _ = Translator.insert(Goods, [(field, 1.5)])
+            self.assertIn('"cost"', sql)
+        finally:
+            field.column = 'price'
+
+
+class DMLCacheTests(unittest.TestCase):
+
+    def test_cache_lives_on_table(self):
+        field = Goods.DB.fields['name']
+        sql, values = Translator.insert(Goods, [(field, 'pen')])
+        self.assertIn(sql, Goods.DB.sql_cache.values())
+        self.assertNotIn(sql, Shop.DB.sql_cache.values())
+        self.assertEqual(values, ('pen', ))
+
+    def test_update_follows_rename(self):
+        field = Goods.DB.fields['name']
+        sql, _ = Translator.update(Goods, [(field, 'pen')])
+        self.assertIn('"name" = %s', sql)
+        try:
+            field.column = 'title'
+            sql, _ = Translator.update(Goods, [(field, 'pen')])
+            self.assertIn('"title" = %s', sql)
+        finally:
+            field.column = 'name'
+
+    def test_ref_helpers_follow_pk(self):
+        shop = Goods.DB.fields['shop']
+        self.assertEqual(Translator.get_value(shop, Shop(id=3)), 3)
+        self.assertIn(('ref_value', ), Shop.DB.sql_cache)
+        pk = Shop.DB.pk
+        before = Translator.type_name(shop)
+        try:
+            pk.type = str
+            Shop._reset_caches()
+            self.assertNotIn(('ref_value', ), Shop.DB.sql_cache)
+            self.assertEqual(Translator.type_name(shop), Translator.type_name(pk, False))
+        finally:
+            pk.type = int
+            Shop._reset_caches()
+        self.assertEqual(Translator.type_name(shop), before)
+
+    def test_create_table_not_cached(self):
+        field = Goods.DB.fields['price']
+        before = Translator.create_table(Goods)
+        try:
+            field.column = 'cost'
+            self.assertIn('"cost"', Translator.create_table(Goods))
+        finally:
+            field.column = 'price'
+        self.assertEqual(Translator.create_table(Goods), before)
+
+
+class QueryCacheTests(unittest.TestCase):
+
+    def test_select_is_reused(self):
+        q = db.query(Goods).select('name')
+        self.assertIs(Translator.select(q), Translator.select(q))
+
+    def test_select_rerenders_after_builder_call(self):
+        q = db.query(Goods).select('name')
+        first = Translator.select(q)
+        q.filter(lambda s: s.price > 10)
+        self.assertNotEqual(Translator.select(q), first)
+
+    def test_select_rerenders_after_direct_edit(self):
+        q = db.query(Goods).select('name')
+        first = Translator.select(q)
+        q.filters.append(q.scheme.price > 10)
+        second = Translator.select(q)
+        self.assertNotEqual(second, first)
+        self.assertIn('WHERE', second)
+
+        q.sort_list.append(q.scheme.name)
+        third = Translator.select(q)
+        self.assertIn('ORDER BY', third)
+
+        q.fields['price'] = q.scheme.price
+        self.assertIn('"price"', Translator.select(q))
+
+        q.window = (None, 5)
+        self.assertIn('LIMIT 5', Translator.select(q))
+
+    def test_with_block_rerenders_after_direct_edit(self):
+        sub = db.query(Goods).select('name')
+        q = db.query()
+        sq = q.with_query(sub)
+        q.select(n=sq.name)
+        first = Translator.select(q)
+        self.assertNotIn('WHERE', first)
+        sub.filters.append(sub.scheme.price > 10)
+        self.assertIn('WHERE', Translator.select(q))
+
+    def test_root_arg_keys_are_stable(self):
+        first = db.query(Goods).filter(lambda s: s.price > 10).select('name')
+        second = db.query(Goods).filter(lambda s: s.price > 20).select('name')
+        self.assertEqual(Translator.select(first), Translator.select(second))
+        self.assertEqual(list(first.args), ['_arg_1'])
+
+    def test_with_args_are_namespaced(self):
+        sub = db.query(Goods).filter(lambda s: s.price > 10).select('name')
+        q = db.query()
+        sq = q.with_query(sub)
+        q.select(n=sq.name).filter(sq.name != 'pen')
+        sql = Translator.select(q)
+        self.assertEqual(q.args, {f'_{sub.name}_arg_1': 10, '_arg_1': 'pen'})
+        self.assertIn(f'%(_{sub.name}_arg_1)s', sql)
+        self.assertIn('%(_arg_1)s', sql)
+        self.assertIn('%(_arg_1)s', Translator.select(sub))
+
+
+class TableInitTests(unittest.TestCase):
+
+    def test_converters(self):
+        goods = Goods(name='pen', kind=2, shop=3, shop__view='Main')
+        self.assertIs(goods.kind, Goods.Kind.TOOL)
+        self.assertIsInstance(goods.shop, DBTable.ItemGetter)
+        self.assertEqual((goods.shop._pk_id, goods.shop._view), (3, 'Main'))
+        self.assertEqual(goods._modified_fields_, {'name', 'kind', 'shop', 'shop__view'})
+        self.assertIsNone(goods.pk)
+
+    def test_wrong_name(self):
+        with self.assertRaises(QuazyFieldNameError):
+            Goods(nme='pen')
+
+    def test_converters_follow_type_change(self):
+        field = Goods.DB.fields['kind']
+        Goods(kind=1)
+        try:
+            field.type = int
+            Goods._reset_caches()
+            self.assertEqual(type(Goods(kind=1).kind), int)
+            field.type = 'not a class'
+            Goods._reset_caches()
+            self.assertEqual(Goods(name='pen').name, 'pen')
+        finally:
+            field.type = Goods.Kind
+            Goods._reset_caches()
+        self.assertIs(Goods(kind=1).kind, Goods.Kind.FOOD)
+
+    def test_caches_kept_on_table(self):
+        Goods(name='pen')
+        self.assertIsNotNone(Goods.DB.init_fields)
+        Goods.resolve_types(globals())
+        self.assertIsNone(Goods.DB.init_fields)
+
+
+class AggregateTests(unittest.TestCase):
+
+    def test_having_without_group_by(self):
+        q = db.query(Goods)
+        q.select(total=q.sum(q.scheme.price))
+        q.filter(q.fields['total'] > 10)
+        sql = Translator.select(q)
+        self.assertNotIn('GROUP BY', sql)
+        self.assertRegex(sql, r'HAVING sum\(\w+\.price\)>')
+        self.assertNotIn('WHERE', sql)
+
+    def test_having_with_group_by(self):
+        q = db.query(Goods)
+        q.select('name', total=q.sum(q.scheme.price))
+        q.filter(q.fields['total'] > 10)
+        q.filter(lambda s: s.price > 1)
+        sql = Translator.select(q)
+        self.assertRegex(sql, r'WHERE .*price>.* GROUP BY 1 HAVING sum\(\w+\.price\)>')